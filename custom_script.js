@@ -13,26 +13,32 @@ function manageTimeBar(elemId, time) {
     if (!window.customTimeBarIds) {
         window.customTimeBarIds = {};
     }
-    
-    try {
-        timeline.setCustomTime(time, elemId);
-    } catch (e) {
-        timeline.addCustomTime(time, elemId);
+
+    // Add the custom time bar once per timeline instance and move that same bar afterwards
+    if (window.customTimeBarIds[elemId] !== timeline) {
+        try {
+            timeline.setCustomTime(time, elemId);
+        } catch (e) {
+            timeline.addCustomTime(time, elemId);
+        }
+        window.customTimeBarIds[elemId] = timeline;
+        return;
     }
-}
 
-function setTimeBarDirect(elemId, time) {
-    manageTimeBar(elemId, time);
+    timeline.setCustomTime(time, elemId);
 }
 
-function setTimeBarNormalized(elemId, start, end, normalizedPos) {
-    const time = start + (end - start) * normalizedPos;
+function setTimeBarDirect(elemId, time) {
     manageTimeBar(elemId, time);
 }
 
 class VideoTimelineSync  {
     constructor(videoId, timelineId, trackLengthItemId) {
         this.timelineId = timelineId;
+        this.trackLength = null;
+        this.lastSyncedTime = null;
+        this.frameRequestId = null;
+        this.videoFrameRequestId = null;
 
         try {
             const trackLengthItemData = getTimelineItemData(timelineId, trackLengthItemId);
@@ -52,52 +58,114 @@ class VideoTimelineSync  {
             return;
         }
 
-        this.progressElement = container.querySelector('progress');
-        if (!this.progressElement) {
-            console.error('Progress element not found');
+        this.videoElement = container.querySelector('video');
+        if (!this.videoElement) {
+            console.error('Video element not found');
+            return;
+        }
+
+        this.timeline = window.visTimelineInstances[timelineId];
+        if (!this.timeline) {
+            console.error(`Timeline instance ${timelineId} not found`);
             return;
         }
         
-        this.setupProgressObserver();
+        this.setupVideoListeners();
+        this.setupTimelineSeeking();
+        this.requestSync();
     }
     
-    setupProgressObserver() {
-        // Create mutation observer to watch for value changes of the progress element
-        this.observer = new MutationObserver((mutations) => {
-            mutations.forEach((mutation) => {
-                if (mutation.type === 'attributes' && mutation.attributeName === 'value') {
-                    this.onProgressUpdate();
+    setupVideoListeners() {
+        // Follow the video element's own clock instead of the player UI, one timeline update per frame at most
+        this.onPlay = () => this.startPlaybackLoop();
+        this.onSeekOrPause = () => this.requestSync();
+
+        this.videoElement.addEventListener('play', this.onPlay);
+        for (const eventName of ['pause', 'seeked', 'seeking', 'loadedmetadata']) {
+            this.videoElement.addEventListener(eventName, this.onSeekOrPause);
+        }
+    }
+
+    setupTimelineSeeking() {
+        // Clicking the empty part of the timeline or its time axis seeks the video to that time
+        this.onTimelineClick = (properties) => {
+            if (properties.item != null || properties.time == null) return;
+            if (properties.what !== 'background' && properties.what !== 'axis') return;
+
+            const duration = this.videoElement.duration;
+            let seconds = Math.max(0, properties.time.valueOf() / 1000);
+            if (Number.isFinite(duration)) {
+                seconds = Math.min(seconds, duration);
+            }
+            this.videoElement.currentTime = seconds;
+            this.requestSync();
+        };
+        this.timeline.on('click', this.onTimelineClick);
+    }
+
+    startPlaybackLoop() {
+        // requestVideoFrameCallback fires once per presented frame with its exact media time, so prefer it when available
+        if (typeof this.videoElement.requestVideoFrameCallback === 'function') {
+            if (this.videoFrameRequestId !== null) return;
+            const onVideoFrame = (now, metadata) => {
+                this.videoFrameRequestId = null;
+                this.syncTimeBarToPlayback(metadata.mediaTime);
+                if (!this.videoElement.paused && !this.videoElement.ended) {
+                    this.videoFrameRequestId = this.videoElement.requestVideoFrameCallback(onVideoFrame);
                 }
-            });
-        });
-        
-        // Observe the progress element for value changes
-        this.observer.observe(this.progressElement, {
-            attributes: true,
-            attributeFilter: ['value']
-        });
+            };
+            this.videoFrameRequestId = this.videoElement.requestVideoFrameCallback(onVideoFrame);
+            return;
+        }
+
+        this.requestSync();
     }
-    
-    onProgressUpdate() {
-        const value = this.progressElement.value;
-        if (value === undefined || value === null) return;
-        
-        // Value is already normalized (between 0 and 1)
-        this.syncTimeBarToPlayback(value);
+
+    requestSync() {
+        // Coalesce bursts of seek and pause events into a single update on the next animation frame
+        if (this.frameRequestId !== null) return;
+        this.frameRequestId = requestAnimationFrame(() => this.onAnimationFrame());
+    }
+
+    onAnimationFrame() {
+        this.frameRequestId = null;
+        this.syncTimeBarToPlayback(this.videoElement.currentTime);
+
+        // Without requestVideoFrameCallback, keep polling the video once per animation frame while it plays
+        const isPlaying = !this.videoElement.paused && !this.videoElement.ended;
+        if (isPlaying && typeof this.videoElement.requestVideoFrameCallback !== 'function') {
+            this.requestSync();
+        }
     }
     
-    syncTimeBarToPlayback(normalizedPosition) {
-        const timeline = window.visTimelineInstances[this.timelineId];
-        if (timeline) {
-            setTimeBarNormalized(this.timelineId, 0, this.trackLength, normalizedPosition);
+    syncTimeBarToPlayback(seconds) {
+        let time = seconds * 1000;
+        if (this.trackLength != null) {
+            time = Math.min(time, this.trackLength);
         }
+        // Skip the layout work of moving the bar when the time hasn't changed
+        if (time === this.lastSyncedTime) return;
+        this.lastSyncedTime = time;
+        setTimeBarDirect(this.timelineId, time);
     }
 
     cleanup() {
-        // Disconnect observer
-        if (this.observer) {
-            this.observer.disconnect();
-            this.observer = null;
+        if (this.videoElement) {
+            this.videoElement.removeEventListener('play', this.onPlay);
+            for (const eventName of ['pause', 'seeked', 'seeking', 'loadedmetadata']) {
+                this.videoElement.removeEventListener(eventName, this.onSeekOrPause);
+            }
+            if (this.videoFrameRequestId !== null) {
+                this.videoElement.cancelVideoFrameCallback(this.videoFrameRequestId);
+                this.videoFrameRequestId = null;
+            }
+        }
+        if (this.frameRequestId !== null) {
+            cancelAnimationFrame(this.frameRequestId);
+            this.frameRequestId = null;
+        }
+        if (this.timeline && this.onTimelineClick) {
+            this.timeline.off('click', this.onTimelineClick);
         }
     }
 }
@@ -164,3 +232,24 @@ function setTimelineWindowToItemLength(timelineId, itemId) {
         console.error('Error setting timeline window:', error);
     }
 }
+
+function formatVideoInputCostInfo(costTable, frameInterval, downscaleSamples, downscaleTarget) {
+    // Mirrors update_video_info_advanced_input in main.py using the table from build_video_input_cost_table
+    if (!costTable) {
+        return "Upload a video first.";
+    }
+
+    const costs = costTable.Costs[downscaleSamples ? downscaleTarget : "Original"];
+    if (!costs || !frameInterval) {
+        return "Video information not available.";
+    }
+
+    const samplesCount = Math.floor(costTable.FrameCount / frameInterval) + 2;
+    const samplesPerSecond = costTable.FrameRate / frameInterval;
+    const cost = costs[samplesCount];
+    if (cost === undefined) {
+        return "Video information not available.";
+    }
+
+    return `Minimum input cost: ${cost}<br />Video will be split into ${samplesCount} samples total. Or approximately ${samplesPerSecond.toFixed(1)} samples per second.`;
+}
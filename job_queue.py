@@ -0,0 +1,489 @@
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import project
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from auto_foley import run_auto_foley as af
+
+# Optional deployment mode where the UI process hands its "long_job" and "comp" work to local worker processes.
+# Jobs go through a SQLite database and results are written to on-disk caches every process on the machine shares,
+# so no external broker is needed and the UI can pick up a result no matter which worker produced it.
+
+# Anchored to this directory so workers started from anywhere share the cache and return paths the UI can open
+SHARED_CACHE_DIR = os.path.abspath(os.getenv('AUTO_FOLEY_SHARED_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), "shared_cache")))
+# The database holds API keys while a job is pending, so it lives outside the directories Gradio serves files from
+JOB_QUEUE_DB = os.path.abspath(os.getenv('AUTO_FOLEY_JOB_QUEUE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_queue_data", "jobs.sqlite3")))
+JOB_SECRETS_DB = os.path.join(os.path.dirname(JOB_QUEUE_DB), "job_secrets.sqlite3")
+PROBE_CACHE_DIR = os.path.join(SHARED_CACHE_DIR, "probes")
+CLIP_CACHE_DIR = os.path.join(SHARED_CACHE_DIR, "clips")
+RENDER_CACHE_DIR = os.path.join(SHARED_CACHE_DIR, "renders")
+CLIP_CACHE_MAX_BYTES = int(os.getenv('AUTO_FOLEY_CLIP_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+RENDER_CACHE_MAX_BYTES = int(os.getenv('AUTO_FOLEY_RENDER_CACHE_MAX_BYTES', 5 * 1024 ** 3))
+# Files used within this many seconds are never evicted, even when the cache is over its size limit
+CACHE_MIN_IDLE = float(os.getenv('AUTO_FOLEY_CACHE_MIN_IDLE', 3600))
+
+# API keys are never written to the job payload. Keys equal to the server defaults are read from the worker's environment,
+# keys a user entered are handed over through a separate store that drops them as soon as the job ends
+SECRET_JOB_ARGUMENTS = {
+    'vision_lm_api_key': 'AUTO_FOLEY_DEFAULT_VISION_LM_API_KEY',
+    'ttsfx_api_key': 'AUTO_FOLEY_DEFAULT_TTSFX_API_KEY',
+}
+
+QUEUES = ("long_job", "comp")
+POLL_INTERVAL = 0.25
+HEARTBEAT_INTERVAL = 5
+# A running job whose worker hasn't sent a heartbeat for this long is assumed to have crashed
+STALE_JOB_AFTER = 30
+MAX_JOB_ATTEMPTS = 2
+# Fail queued jobs after this long if no worker of their queue is alive, e.g. when a queue has no workers at all
+QUEUED_JOB_TIMEOUT = float(os.getenv('AUTO_FOLEY_QUEUED_JOB_TIMEOUT', 120))
+JOB_TIMEOUT = float(os.getenv('AUTO_FOLEY_JOB_TIMEOUT', 3600))
+
+_job_queue_enabled = False
+_job_queue_schema_ready = False
+_worker_processes = []
+
+# --- Shared caches ---
+def _read_json(file_path):
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(file_path, data):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # Write to a temporary file first so other processes never read a partial file
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, file_path)
+
+def prune_cache(directory, max_bytes, min_idle=CACHE_MIN_IDLE):
+    # Evict the least recently used files until the cache fits, cache hits refresh the modification time.
+    # Recently used files are kept, a live session may still play, render or export them
+    idle_before = time.time() - min_idle
+    cached_files = []
+    for root, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            file_path = os.path.join(root, file_name)
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                continue
+            cached_files.append((file_stat.st_mtime, file_stat.st_size, file_path))
+    total_bytes = sum(file_size for _, file_size, _ in cached_files)
+    for modified, file_size, file_path in sorted(cached_files):
+        if total_bytes <= max_bytes or modified > idle_before:
+            break
+        try:
+            os.unlink(file_path)
+            total_bytes -= file_size
+        except OSError:
+            continue
+        try:
+            os.rmdir(os.path.dirname(file_path))  # Only succeeds once the directory is empty
+        except OSError:
+            pass
+
+def touch_clip(audio_source):
+    """
+    Mark the cached clip of an audio source as used so pruning keeps it, or fail clearly if it was already evicted
+    """
+    audio_path = audio_source.get('AudioPath') if audio_source else None
+    if not audio_path or os.path.dirname(os.path.dirname(os.path.abspath(audio_path))) != CLIP_CACHE_DIR:
+        return
+    try:
+        os.utime(audio_path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"The audio of {audio_source.get('SourceSlugID')} expired from the clip cache, regenerate it.") from None
+
+def touch_clips(audio_sources):
+    for group in project.AUDIO_SOURCE_GROUPS:
+        for audio_source in (audio_sources or {}).get(group, []):
+            touch_clip(audio_source)
+
+def get_video_info(video_path):
+    # Hashing the whole upload only pays off when other processes can reuse the probe
+    if not _job_queue_enabled:
+        return af.get_video_info(video_path)
+    probe_path = os.path.join(PROBE_CACHE_DIR, f"{project.hash_file(video_path)}.json")
+    video_info = _read_json(probe_path)
+    if video_info is None:
+        video_info = af.get_video_info(video_path)
+        _write_json(probe_path, video_info)
+    return video_info
+
+def get_render_key(audio_sources, input_video_path):
+    # Key on the file contents rather than the paths, since every upload and generated clip gets a new path
+    render_sources = {}
+    for group in project.AUDIO_SOURCE_GROUPS:
+        render_sources[group] = []
+        for audio_source in audio_sources.get(group, []):
+            render_source = dict(audio_source)
+            audio_path = render_source.pop('AudioPath', None)
+            render_source['AudioHash'] = project.hash_file(audio_path) if audio_path else None
+            render_source.pop('AudioAsset', None)
+            render_sources[group].append(render_source)
+    render_description = json.dumps({"Video": project.hash_file(input_video_path), "AudioSources": render_sources}, sort_keys=True)
+    return hashlib.sha256(render_description.encode()).hexdigest()
+
+# --- Job handlers ---
+def process_video(video_path, frame_interval, width, height, prompt_instruction, vision_lm_api_key):
+    audio_sources, _ = af.process_video(video_path, frame_interval, width, height, prompt_instruction, vision_lm_api_key)
+    return audio_sources
+
+def generate_all_audio(audio_sources, ttsfx_api_key):
+    audio_sources = af.generate_all_audio(audio_sources, ttsfx_api_key)
+    if not _job_queue_enabled:
+        return audio_sources
+    # Move the generated clips into the shared clip cache so they outlive the worker that made them
+    stored_clips = {}
+    for group in project.AUDIO_SOURCE_GROUPS:
+        for audio_source in audio_sources.get(group, []):
+            audio_path = audio_source.get('AudioPath')
+            if audio_path:
+                if audio_path not in stored_clips:
+                    stored_clips[audio_path] = project.get_asset_path(project.store_asset(audio_path, CLIP_CACHE_DIR), CLIP_CACHE_DIR)
+                    os.utime(stored_clips[audio_path])
+                audio_source['AudioPath'] = stored_clips[audio_path]
+    prune_cache(CLIP_CACHE_DIR, CLIP_CACHE_MAX_BYTES)
+    return audio_sources
+
+def combine_video_and_audio(audio_sources, input_video_path, output_video_name):
+    render_directory = os.path.join(RENDER_CACHE_DIR, get_render_key(audio_sources, input_video_path))
+    output_video_path = os.path.join(render_directory, output_video_name)
+    if os.path.exists(output_video_path):
+        os.utime(output_video_path)
+        return output_video_path
+    os.makedirs(render_directory, exist_ok=True)
+    # Render next to the final path and rename, so a half written render is never picked up from the cache
+    temp_name, file_extension = os.path.splitext(output_video_name)
+    temp_video_path = os.path.join(render_directory, f"{temp_name}.{os.getpid()}.tmp{file_extension}")
+    rendered_video_path = af.combine_video_and_audio(audio_sources, input_video_path, temp_video_path)
+    os.replace(rendered_video_path, output_video_path)
+    prune_cache(RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES)
+    return output_video_path
+
+JOB_HANDLERS = {
+    "process_video": ("long_job", process_video),
+    "generate_all_audio": ("long_job", generate_all_audio),
+    "combine_video_and_audio": ("comp", combine_video_and_audio),
+}
+
+# --- Queue ---
+def _create_private_file(file_path):
+    # Only the user running Auto-Foley may read the databases, they can hold API keys
+    os.makedirs(os.path.dirname(file_path), mode=0o700, exist_ok=True)
+    os.close(os.open(file_path, os.O_CREAT | os.O_WRONLY, 0o600))
+
+def _open_connection():
+    connection = sqlite3.connect(JOB_QUEUE_DB, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("ATTACH DATABASE ? AS secrets", (JOB_SECRETS_DB,))
+    # Overwrite deleted keys and keep the rollback journal in memory, so no key outlives its job on disk
+    connection.execute("PRAGMA secrets.secure_delete=ON")
+    connection.execute("PRAGMA secrets.journal_mode=MEMORY")
+    return connection
+
+def _connect():
+    global _job_queue_schema_ready
+    if _job_queue_schema_ready:
+        return _open_connection()
+
+    _create_private_file(JOB_QUEUE_DB)
+    _create_private_file(JOB_SECRETS_DB)
+    connection = _open_connection()
+    # WAL lets the UI poll for results while a worker is writing
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            queue TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            worker TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL,
+            updated REAL NOT NULL
+        )
+    """)
+    connection.execute("CREATE INDEX IF NOT EXISTS jobs_queue_status ON jobs (queue, status, created)")
+    # Workers report here on every poll and heartbeat, so the UI can tell a busy queue from one nobody serves
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS workers (
+            id TEXT PRIMARY KEY,
+            queue TEXT NOT NULL,
+            last_seen REAL NOT NULL
+        )
+    """)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS secrets.job_secrets (
+            job_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (job_id, name)
+        )
+    """)
+    _job_queue_schema_ready = True
+    return connection
+
+def _delete_finished_job_secrets(connection):
+    connection.execute("DELETE FROM secrets.job_secrets WHERE job_id NOT IN (SELECT id FROM jobs WHERE status IN ('queued', 'running'))")
+
+def submit_job(kind, **kwargs):
+    queue, _ = JOB_HANDLERS[kind]
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    secrets = {}
+    for name, env_name in SECRET_JOB_ARGUMENTS.items():
+        if kwargs.get(name):
+            if kwargs[name] == os.getenv(env_name):
+                kwargs[name] = {"Env": env_name}
+            else:
+                secrets[name] = kwargs[name]
+                kwargs[name] = {"Secret": name}
+    connection = _connect()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        connection.executemany("INSERT INTO secrets.job_secrets (job_id, name, value) VALUES (?, ?, ?)", [(job_id, name, value) for name, value in secrets.items()])
+        connection.execute(
+            "INSERT INTO jobs (id, queue, kind, payload, status, created, updated) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+            (job_id, queue, kind, json.dumps(kwargs), now, now)
+        )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+    return job_id
+
+def _recover_stale_jobs(connection):
+    # Requeue jobs of crashed workers, or fail them once they have used up their attempts
+    stale_before = time.time() - STALE_JOB_AFTER
+    connection.execute(
+        "UPDATE jobs SET status = 'failed', payload = NULL, error = 'The worker running this job stopped responding.', updated = ? "
+        "WHERE status = 'running' AND updated < ? AND attempts >= ?",
+        (time.time(), stale_before, MAX_JOB_ATTEMPTS)
+    )
+    connection.execute(
+        "UPDATE jobs SET status = 'queued', worker = NULL, updated = ? WHERE status = 'running' AND updated < ?",
+        (time.time(), stale_before)
+    )
+    connection.execute("DELETE FROM workers WHERE last_seen < ?", (stale_before,))
+    _delete_finished_job_secrets(connection)
+
+def recover_stale_jobs():
+    connection = _connect()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        _recover_stale_jobs(connection)
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+def _report_worker(connection, worker_id, queue):
+    connection.execute("INSERT OR REPLACE INTO workers (id, queue, last_seen) VALUES (?, ?, ?)", (worker_id, queue, time.time()))
+
+def has_live_worker(queue):
+    connection = _connect()
+    try:
+        worker = connection.execute("SELECT id FROM workers WHERE queue = ? AND last_seen >= ? LIMIT 1", (queue, time.time() - STALE_JOB_AFTER)).fetchone()
+    finally:
+        connection.close()
+    return worker is not None
+
+def heartbeat_job(job_id, worker_id, queue):
+    connection = _connect()
+    try:
+        connection.execute("UPDATE jobs SET updated = ? WHERE id = ? AND status = 'running' AND worker = ?", (time.time(), job_id, worker_id))
+        _report_worker(connection, worker_id, queue)
+    finally:
+        connection.close()
+
+def claim_job(queue, worker_id):
+    connection = _connect()
+    try:
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can never claim the same job
+        connection.execute("BEGIN IMMEDIATE")
+        _report_worker(connection, worker_id, queue)
+        _recover_stale_jobs(connection)
+        job = connection.execute(
+            "SELECT id, kind, payload FROM jobs WHERE queue = ? AND status = 'queued' ORDER BY created LIMIT 1", (queue,)
+        ).fetchone()
+        if job is not None:
+            connection.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker_id, time.time(), job['id'])
+            )
+            job = dict(job)
+            job['secrets'] = dict(connection.execute("SELECT name, value FROM secrets.job_secrets WHERE job_id = ?", (job['id'],)).fetchall())
+        connection.execute("COMMIT")
+        return job
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+def finish_job(job_id, worker_id, result=None, error=None):
+    connection = _connect()
+    try:
+        # Only the worker that still owns the job may finish it, not one whose job was requeued or timed out meanwhile
+        connection.execute(
+            "UPDATE jobs SET status = ?, payload = NULL, result = ?, error = ?, updated = ? WHERE id = ? AND status = 'running' AND worker = ?",
+            ("failed" if error is not None else "done", result, error, time.time(), job_id, worker_id)
+        )
+        _delete_finished_job_secrets(connection)
+    finally:
+        connection.close()
+
+def get_job(job_id):
+    connection = _connect()
+    try:
+        job = connection.execute("SELECT id, queue, kind, status, result, error, worker, created, updated FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        connection.close()
+    return dict(job) if job is not None else None
+
+def fail_job(job_id, error):
+    connection = _connect()
+    try:
+        connection.execute(
+            "UPDATE jobs SET status = 'failed', payload = NULL, error = ?, updated = ? WHERE id = ? AND status IN ('queued', 'running')",
+            (error, time.time(), job_id)
+        )
+        _delete_finished_job_secrets(connection)
+    finally:
+        connection.close()
+
+def wait_for_job(job_id, timeout=JOB_TIMEOUT):
+    deadline = time.time() + timeout
+    while True:
+        job = get_job(job_id)
+        if job is None:
+            raise KeyError(f"Job {job_id} not found")
+        if job['status'] == "done":
+            return json.loads(job['result'])
+        if job['status'] == "failed":
+            raise RuntimeError(job['error'])
+
+        now = time.time()
+        error = None
+        if job['status'] == "running" and now - job['updated'] > STALE_JOB_AFTER:
+            # Don't rely on another worker polling this queue to notice the crash
+            recover_stale_jobs()
+        if now > deadline:
+            error = f"The job did not finish within {timeout:.0f} seconds."
+        elif job['status'] == "queued" and now - job['updated'] > QUEUED_JOB_TIMEOUT and not has_live_worker(job['queue']):
+            # Busy workers still poll between jobs and send heartbeats, so only a queue nobody serves ends up here
+            error = f"No {job['queue']} worker is running to pick up the job."
+        if error is not None:
+            fail_job(job_id, error)
+            raise TimeoutError(error)
+        time.sleep(POLL_INTERVAL)
+
+def run_job(kind, **kwargs):
+    """
+    Run a job on the worker pool when the job queue is enabled, otherwise run it in this process
+    """
+    if not _job_queue_enabled:
+        _, handler = JOB_HANDLERS[kind]
+        return handler(**kwargs)
+    return wait_for_job(submit_job(kind, **kwargs))
+
+# --- Worker processes ---
+def _send_heartbeats(job_id, worker_id, queue, stop_event):
+    while not stop_event.wait(HEARTBEAT_INTERVAL):
+        try:
+            heartbeat_job(job_id, worker_id, queue)
+        except Exception as e:
+            print(f"Worker {worker_id} could not send a heartbeat for job {job_id}: {e}", file=sys.stderr)
+
+def _load_job_arguments(job):
+    kwargs = json.loads(job['payload'])
+    for name in SECRET_JOB_ARGUMENTS:
+        value = kwargs.get(name)
+        if isinstance(value, dict) and "Env" in value:
+            kwargs[name] = os.getenv(value["Env"])
+        elif isinstance(value, dict) and "Secret" in value:
+            if name not in job['secrets']:
+                raise RuntimeError("The API key of this job is no longer available, please try again.")
+            kwargs[name] = job['secrets'][name]
+    return kwargs
+
+def _run_claimed_job(job, worker_id, queue):
+    stop_heartbeats = threading.Event()
+    heartbeat_thread = threading.Thread(target=_send_heartbeats, args=(job['id'], worker_id, queue, stop_heartbeats), daemon=True)
+    heartbeat_thread.start()
+    try:
+        _, handler = JOB_HANDLERS[job['kind']]
+        # Serialize inside the try as well, a result that isn't JSON must fail the job rather than the worker
+        result = json.dumps(handler(**_load_job_arguments(job)))
+    except Exception as e:
+        finish_job(job['id'], worker_id, error=str(e) or type(e).__name__)
+    else:
+        finish_job(job['id'], worker_id, result=result)
+    finally:
+        stop_heartbeats.set()
+        heartbeat_thread.join()
+
+def run_worker(queue):
+    global _job_queue_enabled
+    _job_queue_enabled = True  # Handlers running in a worker always write to the shared caches
+    worker_id = f"{queue}-{os.getpid()}"
+    while True:
+        # Keep the worker alive on any error, e.g. a locked database, and retry on the next poll
+        try:
+            job = claim_job(queue, worker_id)
+            if job is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+            _run_claimed_job(job, worker_id, queue)
+        except Exception as e:
+            print(f"Worker {worker_id} error: {e}", file=sys.stderr)
+            time.sleep(POLL_INTERVAL)
+
+def stop_worker_pool():
+    for process in _worker_processes:
+        process.terminate()
+    for process in _worker_processes:
+        process.wait()
+    _worker_processes.clear()
+
+def is_job_queue_enabled():
+    return _job_queue_enabled
+
+def enable_job_queue(long_job_workers=0, comp_workers=0):
+    global _job_queue_enabled
+    _job_queue_enabled = True
+    _connect().close()  # Create the database before the workers race to do so
+    # Workers are started as fresh interpreters so they don't build the Gradio UI of main.py
+    for queue, worker_count in (("long_job", long_job_workers), ("comp", comp_workers)):
+        for _ in range(worker_count):
+            _worker_processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "--queue", queue]))
+    if _worker_processes:
+        atexit.register(stop_worker_pool)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run an Auto-Foley worker that takes jobs from the shared job queue.")
+    parser.add_argument("--queue", choices=QUEUES, required=True)
+    args = parser.parse_args()
+    try:
+        run_worker(args.queue)
+    except KeyboardInterrupt:
+        pass
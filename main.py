@@ -1,8 +1,14 @@
+import argparse
 import gradio as gr
+import job_queue
 import json
 import math
+import numpy as np
 import os
+import project
+import re
 import shutil
+import speculation
 from auto_foley import run_auto_foley as af
 from datetime import datetime
 from gradio_vistimeline import VisTimeline
@@ -10,6 +16,7 @@ from gradio_vistimeline import VisTimeline
 TIMELINE_ID = "editor-tab-timeline"
 OUTPUT_VIDEO_ID = "output-video-player"
 TRACK_LENGTH_ID = "track-length-item"
+DOWNSCALE_RESOLUTION_CHOICES = ["512px", "768px", "1024px"]
 
 # --- Demo specific helper functions ---
 def parse_date_to_milliseconds(date):
@@ -78,6 +85,33 @@ def update_video_info_advanced_input(frame_interval, downscale_samples, downscal
     except Exception as e:
         return f"Error calculating frame interval: {str(e)}", video_info
 
+def build_video_input_cost_table(video_info):
+    """
+    Precompute the input cost of every frame interval the slider allows at every sample resolution, so the client can show it without a server round trip
+    """
+    if not video_info:
+        return None
+    frame_count = video_info.get('FrameCount', 0)
+    frame_rate = video_info.get('FrameRate', 0)
+    max_interval = frame_count // 2
+    if not frame_count or not frame_rate or max_interval < 1:
+        return None
+
+    # Many intervals share a sample count, so only the distinct counts need to be priced.
+    # af.calculate_video_input_cost only takes a single sample count, so the pricing itself stays a loop over those
+    frame_intervals = np.arange(1, max_interval + 1)
+    samples_counts = np.unique(frame_count // frame_intervals + 2)
+
+    resolutions = {"Original": (video_info['Width'], video_info['Height'])}
+    for downscale_target in DOWNSCALE_RESOLUTION_CHOICES:
+        max_side = int(downscale_target[:-2])
+        resolutions[downscale_target] = af.downscale_dimensions(video_info['Width'], video_info['Height'], max_side)
+
+    cost_table = {"FrameCount": int(frame_count), "FrameRate": frame_rate, "Costs": {}}
+    for resolution, (width, height) in resolutions.items():
+        cost_table["Costs"][resolution] = {int(samples_count): str(af.calculate_video_input_cost(width, height, int(samples_count))) for samples_count in samples_counts}
+    return cost_table
+
 # --- Tab 1 UI State Management ---
 def trigger_frame_interval_slider_rerender(on_video_uploaded_state):
     return not on_video_uploaded_state
@@ -118,27 +152,40 @@ def go_to_tab(id):
     return gr.Tabs(selected=id)
 
 # --- Tab 1 Functionality ---
-def on_video_upload(video):
+def on_video_upload(video, request: gr.Request):
     if video is None:
+        speculation.cancel_speculation(request.session_hash)
         return get_generate_descriptions_button(False), get_generate_audio_button(False), None, "", None, ""
     try:
-        video_info = af.get_video_info(video)
+        video_info = job_queue.get_video_info(video)
+        # Start pre-processing while the user is still looking at the input settings
+        speculation.start_speculation(request.session_hash, video)
     except Exception as e:
         gr.Warning(f"Error: {e}")
     return get_generate_descriptions_button(True), get_generate_audio_button(True), video_info, "", None, ""
 
-def generate_descriptions(video, video_info, prompt_instruction, vision_lm_api_key):
+def on_session_close(request: gr.Request):
+    speculation.cancel_speculation(request.session_hash)
+
+def apply_current_frame_interval(video_info, current_frame_interval):
+    # The state is only saved on slider release, so take the value the slider shows right now
+    if video_info is not None and current_frame_interval:
+        video_info['FrameInterval'] = int(current_frame_interval)
+    return video_info
+
+def generate_descriptions(video, video_info, current_frame_interval, prompt_instruction, vision_lm_api_key, request: gr.Request):
     if not video or video_info is None:
         return None, "", video_info
     try:
-        audio_sources, _ = af.process_video(video, video_info['FrameInterval'], video_info['DownscaledWidth'], video_info['DownscaledHeight'], prompt_instruction, vision_lm_api_key)
+        video_info = apply_current_frame_interval(video_info, current_frame_interval)
+        audio_sources = job_queue.run_job("process_video", video_path=video, frame_interval=video_info['FrameInterval'], width=video_info['DownscaledWidth'], height=video_info['DownscaledHeight'], prompt_instruction=prompt_instruction, vision_lm_api_key=vision_lm_api_key)
         json_output = json.dumps(audio_sources, indent=4)
         return json_output, json_output, audio_sources
     except Exception as e:
         gr.Warning(f"Error: {e}")
         return None, "", {}
 
-def generate_all_audio(video, video_info, prompt_instruction, generate_descriptions_json_output, generate_descriptions_json_textbox, vision_lm_api_key, ttsfx_api_key, progress=gr.Progress()):
+def generate_all_audio(video, video_info, current_frame_interval, prompt_instruction, generate_descriptions_json_output, generate_descriptions_json_textbox, vision_lm_api_key, ttsfx_api_key, request: gr.Request, progress=gr.Progress()):
     # Check if user has provided their own descriptions through the advanced input textbox
     valid_json = True
     if generate_descriptions_json_textbox and not generate_descriptions_json_textbox.isspace():
@@ -161,7 +208,8 @@ def generate_all_audio(video, video_info, prompt_instruction, generate_descripti
     if not valid_json:
         progress((1, 3), desc="Processing video")
         try:
-            audio_sources, _ = af.process_video(video, video_info['FrameInterval'], video_info['DownscaledWidth'], video_info['DownscaledHeight'], prompt_instruction, vision_lm_api_key)
+            video_info = apply_current_frame_interval(video_info, current_frame_interval)
+            audio_sources = job_queue.run_job("process_video", video_path=video, frame_interval=video_info['FrameInterval'], width=video_info['DownscaledWidth'], height=video_info['DownscaledHeight'], prompt_instruction=prompt_instruction, vision_lm_api_key=vision_lm_api_key)
             json_output = json.dumps(audio_sources, indent=4)
             generate_descriptions_json_output = json_output
             generate_descriptions_json_textbox = json_output
@@ -170,7 +218,7 @@ def generate_all_audio(video, video_info, prompt_instruction, generate_descripti
     # Generate audio files all the audio sources 
     progress((2, 3), desc="Generating audio")
     try:
-        audio_sources = af.generate_all_audio(audio_sources, ttsfx_api_key)
+        audio_sources = job_queue.run_job("generate_all_audio", audio_sources=audio_sources, ttsfx_api_key=ttsfx_api_key)
     except Exception as e:
         raise gr.Error(f"Could not generate audio: {e}")
     return "", audio_sources, generate_descriptions_json_output, generate_descriptions_json_textbox
@@ -191,6 +239,15 @@ def set_render_button_state(unrendered_changes_flag):
 def reset_new_audio_source_counter():
     return 0
 
+def get_new_audio_source_counter(audio_sources):
+    # Continue numbering after the new audio sources that already exist, e.g. in a loaded project
+    counter = 0
+    for audio_source in audio_sources.get('AudioSources', []) + audio_sources.get('AmbientAudioSources', []):
+        match = re.fullmatch(r"NewAudioSource(\d+)", str(audio_source['SourceSlugID']))
+        if match:
+            counter = max(counter, int(match.group(1)))
+    return counter
+
 def set_buttons_state_selected_audio_source(selected_audio_source):
     set_interactive = selected_audio_source is not None
     return gr.Button(value="Delete Selected Audio Source", variant="stop", interactive=set_interactive), gr.Button("Generate", variant="primary", interactive=set_interactive), gr.Button("Save Changes", interactive=set_interactive)
@@ -199,7 +256,13 @@ def sync_form_to_selected_audio_source(selected_audio_source):
     accordion_label = "Edit Audio Source Properties"
     if selected_audio_source is None:
         return gr.Accordion(label=accordion_label, open=False), 1.0, None, ""
-    return gr.Accordion(label=accordion_label, open=True), selected_audio_source.get('Volume', 1.0), selected_audio_source.get('AudioPath', None), selected_audio_source['SoundDescription']
+    try:
+        audio_path = project.resolve_audio_source(selected_audio_source).get('AudioPath', None)
+        job_queue.touch_clip(selected_audio_source)
+    except Exception as e:
+        gr.Warning(f"Could not load the audio of this audio source: {e}")
+        audio_path = None
+    return gr.Accordion(label=accordion_label, open=True), selected_audio_source.get('Volume', 1.0), audio_path, selected_audio_source['SoundDescription']
 
 # --- Tab 2 VisTimelineData & AudioSource helper functions  ---
 def parse_single_audio_source(audio_source, video_fps, group_id):
@@ -294,35 +357,48 @@ def on_timeline_input(timeline: dict[str, any], all_audio_sources, video_info):
     return all_audio_sources
 
 # --- Tab 2 Functionality ---
-def comp_all_audio_to_video(audio_sources, video_info):
+def comp_all_audio_to_video(audio_sources, video_info, request: gr.Request):
     try:
         input_video_path = video_info['VideoPath']
         if not audio_sources:
             input_video_path
             return 
     
-        output_directory = "output_videos"
-        # Ensure the output directory exists
-        if not os.path.exists(output_directory):
-            os.makedirs(output_directory)
-        else:
-            # Clear the output directory before saving the new video
-            for filename in os.listdir(output_directory):
-                file_path = os.path.join(output_directory, filename)
-                try:
-                    if os.path.isfile(file_path) or os.path.islink(file_path):
-                        os.unlink(file_path)
-                    elif os.path.isdir(file_path):
-                        shutil.rmtree(file_path)
-                except Exception as e:
-                    raise OSError(f"Failed to delete {file_path}. Reason: {e}")
-
-        # Generate a unique output filename
-        input_filename = os.path.basename(input_video_path)
-        file_name_without_extension, file_extension = os.path.splitext(input_filename)
-        output_video_name = f"{file_name_without_extension}_output{file_extension}"
-        output_video_path = os.path.join(output_directory, output_video_name)
-        output_video_path = af.combine_video_and_audio(audio_sources, input_video_path, output_video_path)
+        project.resolve_all_audio_sources(audio_sources)
+        job_queue.touch_clips(audio_sources)
+        # Prefer the audio-less video stream pre-extracted right after the upload
+        video_only_path = speculation.claim_stripped_video(request.session_hash, input_video_path) or input_video_path
+        try:
+            input_filename = os.path.basename(input_video_path)
+            file_name_without_extension, file_extension = os.path.splitext(input_filename)
+            output_video_name = f"{file_name_without_extension}_output{file_extension}"
+
+            # Render workers write to the shared render cache instead of the output directory
+            if job_queue.is_job_queue_enabled():
+                return job_queue.run_job("combine_video_and_audio", audio_sources=audio_sources, input_video_path=video_only_path, output_video_name=output_video_name)
+
+            output_directory = "output_videos"
+            # Ensure the output directory exists
+            if not os.path.exists(output_directory):
+                os.makedirs(output_directory)
+            else:
+                # Clear the output directory before saving the new video
+                for filename in os.listdir(output_directory):
+                    file_path = os.path.join(output_directory, filename)
+                    try:
+                        if os.path.isfile(file_path) or os.path.islink(file_path):
+                            os.unlink(file_path)
+                        elif os.path.isdir(file_path):
+                            shutil.rmtree(file_path)
+                    except Exception as e:
+                        raise OSError(f"Failed to delete {file_path}. Reason: {e}")
+
+            # Generate a unique output filename
+            output_video_path = os.path.join(output_directory, output_video_name)
+            output_video_path = af.combine_video_and_audio(audio_sources, video_only_path, output_video_path)
+        finally:
+            # Let the speculative job clean up the audio-less copy again once the render is done with it
+            speculation.release_stripped_video(video_only_path)
     except Exception as e:
         gr.Warning(f"Failed to add the audio to the video: {e}")
     return output_video_path
@@ -377,6 +453,7 @@ def overwrite_changes_to_selected_audio_source(volume, audio_path, prompt, selec
         'AudioPath': audio_path,
         'Volume': float(volume)
     })
+    updated_source.pop('AudioAsset', None) # The audio path from the form replaces any audio loaded from a project
     
     audio_sources = all_audio_sources.get('AudioSources', [])
     ambient_sources = all_audio_sources.get('AmbientAudioSources', [])
@@ -391,6 +468,23 @@ def overwrite_changes_to_selected_audio_source(volume, audio_path, prompt, selec
             break
     return {'AudioSources': audio_sources, 'AmbientAudioSources': ambient_sources}, selected_audio_source
 
+def export_project(audio_sources, video_info):
+    try:
+        job_queue.touch_clips(audio_sources)
+        return project.save_project(audio_sources, video_info)
+    except Exception as e:
+        gr.Warning(f"Could not export the project: {e}")
+        return None
+
+def import_project(project_file):
+    if not project_file:
+        raise gr.Error("Select a project file to import.")
+    try:
+        audio_sources, video_info = project.load_project(project_file)
+    except Exception as e:
+        raise gr.Error(f"Could not import the project: {e}")
+    return audio_sources, video_info, None, get_new_audio_source_counter(audio_sources)
+
 # --- Custom JS and CSS ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
 js_path = os.path.join(current_dir, 'custom_script.js')
@@ -431,6 +525,8 @@ with gr.Blocks(head=head) as ui:
                 video_input = gr.Video(label="Upload a Video", height=206, sources='upload')
                 video_info_display = gr.Textbox(label="Video Information", lines=6, interactive=False)
 
+            current_frame_interval_number = gr.Number(value=None, visible=False)
+
             with gr.Accordion("Input control", open=False):
                 @gr.render(inputs=[video_input_info_state], triggers=[trigger_frame_interval_slider_render.change])
                 def render_frame_interval_slider(video_info):
@@ -438,6 +534,8 @@ with gr.Blocks(head=head) as ui:
                     frame_rate = video_info.get('FrameRate', 0)
                     max_interval = total_frames // 2
 
+                    video_input_cost_table = gr.JSON(value=build_video_input_cost_table(video_info), visible=False)
+
                     with gr.Row(equal_height=True):
                         with gr.Column():
                             cost_and_frame_interval_info = gr.Markdown("Upload a video")
@@ -458,14 +556,32 @@ with gr.Blocks(head=head) as ui:
                             )
 
                             downscale_resolution_dropdown = gr.Dropdown(
-                                choices=["512px", "768px", "1024px"], 
+                                choices=DOWNSCALE_RESOLUTION_CHOICES, 
                                 value="512px",
                                 type="value",
                                 interactive=True,
                                 label="Max side"
                             )
 
+                    # Show the cost from the precomputed table on every change, and only save to the job state on release
+                    for input_control in [frame_interval_slider, downscale_samples_checkbox, downscale_resolution_dropdown]:
+                        input_control.change(
+                            fn=None,
+                            inputs=[video_input_cost_table, frame_interval_slider, downscale_samples_checkbox, downscale_resolution_dropdown],
+                            outputs=cost_and_frame_interval_info,
+                            js='(costTable, frameInterval, downscaleSamples, downscaleTarget) => formatVideoInputCostInfo(costTable, frameInterval, downscaleSamples, downscaleTarget)'
+                        )
+
+                    # Mirror the slider into a component the generate handlers can read, also on the client only.
+                    # That covers arrow keys and the number box, which don't fire release
                     frame_interval_slider.change(
+                        fn=None,
+                        inputs=frame_interval_slider,
+                        outputs=current_frame_interval_number,
+                        js='(frameInterval) => frameInterval'
+                    )
+
+                    frame_interval_slider.release(
                         fn=update_video_info_advanced_input,
                         inputs=[frame_interval_slider, downscale_samples_checkbox, downscale_resolution_dropdown, video_input_info_state],
                         outputs=[cost_and_frame_interval_info, video_input_info_state]
@@ -550,6 +666,10 @@ with gr.Blocks(head=head) as ui:
                     selected_audio_overwrite_audio_button = gr.Button("Generate", variant="primary", interactive=False)
                 save_changes_button = gr.Button("Save Changes", interactive=False)
 
+            with gr.Accordion("Project", open=False):
+                project_file = gr.File(label="Project File", file_types=[project.PROJECT_FILE_EXTENSION], type="filepath")
+                export_project_button = gr.Button("Export Project")
+
         # --- Tab 3 ---
         with gr.TabItem("Set API Keys", id=2) as settings_tab:
             vision_lm_api_key_textbox = gr.Textbox(label="OpenAI API Key", type='password')
@@ -564,6 +684,8 @@ with gr.Blocks(head=head) as ui:
         fn=on_video_upload,
         inputs=video_input,
         outputs=[generate_descriptions_button, generate_all_audio_button, video_input_info_state, custom_instruction_textbox, generate_descriptions_json_output, generate_descriptions_json_textbox]
+    ).then(
+        fn=lambda: None, outputs=current_frame_interval_number # Forget the slider value of the previous video
     ).then(
         fn=trigger_frame_interval_slider_rerender,
         inputs=trigger_frame_interval_slider_render,
@@ -580,7 +702,7 @@ with gr.Blocks(head=head) as ui:
         fn=set_generate_buttons_inactive, outputs=[generate_descriptions_button, generate_all_audio_button]
     ).then(
         fn=generate_descriptions,
-        inputs=[video_input, video_input_info_state, custom_instruction_textbox, vision_lm_api_key_state],
+        inputs=[video_input, video_input_info_state, current_frame_interval_number, custom_instruction_textbox, vision_lm_api_key_state],
         outputs=[generate_descriptions_json_output, generate_descriptions_json_textbox, audio_sources_state],
         concurrency_id="long_job"
     ).then(
@@ -603,7 +725,7 @@ with gr.Blocks(head=head) as ui:
         fn=set_generate_buttons_inactive, outputs=[generate_descriptions_button, generate_all_audio_button]
     ).then(
         fn=generate_all_audio,
-        inputs=[video_input, video_edit_info_state, custom_instruction_textbox, generate_descriptions_json_output, generate_descriptions_json_textbox, vision_lm_api_key_state, ttsfx_api_key_state],
+        inputs=[video_input, video_edit_info_state, current_frame_interval_number, custom_instruction_textbox, generate_descriptions_json_output, generate_descriptions_json_textbox, vision_lm_api_key_state, ttsfx_api_key_state],
         outputs=[generate_all_progress_textbox, audio_sources_state, generate_descriptions_json_output, generate_descriptions_json_textbox],
         concurrency_id="long_job"
     ).then(
@@ -740,6 +862,30 @@ with gr.Blocks(head=head) as ui:
         fn=lambda: True, outputs=unrendered_changes_flag
     )
 
+    export_project_button.click(
+        fn=export_project,
+        inputs=[audio_sources_state, video_edit_info_state],
+        outputs=project_file
+    )
+
+    project_file.upload(
+        fn=import_project,
+        inputs=project_file,
+        outputs=[audio_sources_state, video_edit_info_state, selected_audio_source_state, new_audio_sources_counter]
+    ).then(
+        fn=parse_audio_sources_to_timeline_data,
+        inputs=[audio_sources_state, video_edit_info_state],
+        outputs=timeline
+    ).then(
+        fn=lambda: None, outputs=video_comp_output
+    ).then(
+        fn=lambda: False, outputs=set_timeline_window_on_next_tab_change
+    ).then(
+        fn=lambda trigger: not trigger, inputs=trigger_timeline_window_focus, outputs=trigger_timeline_window_focus
+    ).then(
+        fn=lambda: True, outputs=unrendered_changes_flag
+    )
+
     # Tab 3 interactions
     vision_lm_api_key_textbox.input(
         fn=lambda a: a,
@@ -753,10 +899,25 @@ with gr.Blocks(head=head) as ui:
         outputs=ttsfx_api_key_state
     )
 
+    ui.unload(
+        fn=on_session_close
+    )
+
     ui.load(
         fn=lambda: (os.getenv('AUTO_FOLEY_DEFAULT_VISION_LM_API_KEY'), os.getenv('AUTO_FOLEY_DEFAULT_TTSFX_API_KEY')),
         outputs=[vision_lm_api_key_state, ttsfx_api_key_state]
     )
 
 if __name__ == "__main__":
-    ui.launch(show_api=False)
+    parser = argparse.ArgumentParser(description="Auto-Foley Editor")
+    parser.add_argument("--job-queue", action="store_true", help="Hand long jobs and renders to worker processes through the shared job queue")
+    parser.add_argument("--long-job-workers", type=int, default=2, help="Number of local workers for video processing and audio generation")
+    parser.add_argument("--comp-workers", type=int, default=1, help="Number of local workers for rendering")
+    args = parser.parse_args()
+
+    if args.job_queue:
+        job_queue.enable_job_queue(args.long_job_workers, args.comp_workers)
+        # The event handlers only wait on the workers, so let as many run at once as there are workers
+        ui.queue(default_concurrency_limit=max(args.long_job_workers, args.comp_workers, 1))
+    # The asset store and the shared cache live next to this file, which may be outside the working directory
+    ui.launch(show_api=False, allowed_paths=[project.PROJECT_ASSETS_DIR, project.PROJECT_EXPORTS_DIR, job_queue.CLIP_CACHE_DIR, job_queue.RENDER_CACHE_DIR])
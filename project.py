@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from datetime import datetime
+
+# Projects are stored as a small JSON file holding the audio sources and the video info.
+# Audio and video files are not inlined. They are copied once into a content-addressed asset store
+# and referenced by their hash, so loading a project never touches the media files themselves.
+
+PROJECT_FORMAT = "auto-foley-project"
+PROJECT_FORMAT_VERSION = 1
+PROJECT_FILE_EXTENSION = ".afproj"
+# Anchored to this directory so every process shares the same store, whatever its working directory
+PROJECT_ASSETS_DIR = os.path.abspath(os.getenv('AUTO_FOLEY_PROJECT_ASSETS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), "project_assets")))
+PROJECT_EXPORTS_DIR = os.path.abspath(os.getenv('AUTO_FOLEY_PROJECT_EXPORTS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), "project_exports")))
+
+AUDIO_SOURCE_GROUPS = ('AudioSources', 'AmbientAudioSources')
+# A SHA-256 hash with an optional file extension, anything else could point outside the asset store
+ASSET_REF_PATTERN = re.compile(r"^[0-9a-f]{64}(\.[A-Za-z0-9]+)?$")
+REQUIRED_VIDEO_INFO_KEYS = {'FrameRate': (int, float), 'FrameCount': (int, float), 'Duration': (int, float)}
+REQUIRED_AUDIO_SOURCE_KEYS = {'SourceSlugID': (str, int), 'SoundDescription': str, 'StartFrameIndex': (int, float), 'EndFrameIndex': (int, float)}
+
+# --- Asset store ---
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def is_valid_asset_ref(asset_ref):
+    return isinstance(asset_ref, str) and ASSET_REF_PATTERN.match(asset_ref) is not None
+
+def get_asset_path(asset_ref, assets_dir=PROJECT_ASSETS_DIR):
+    if not is_valid_asset_ref(asset_ref):
+        raise ValueError(f"Invalid asset reference {asset_ref!r}")
+    # Shard by the first two characters of the hash to keep directories small
+    return os.path.join(assets_dir, asset_ref[:2], asset_ref)
+
+def store_asset(file_path, assets_dir=PROJECT_ASSETS_DIR):
+    _, file_extension = os.path.splitext(file_path)
+    asset_ref = f"{hash_file(file_path)}{file_extension}"
+    asset_path = get_asset_path(asset_ref, assets_dir)
+    if not os.path.exists(asset_path):
+        os.makedirs(os.path.dirname(asset_path), exist_ok=True)
+        temp_path = f"{asset_path}.{os.getpid()}.tmp"
+        shutil.copyfile(file_path, temp_path)
+        os.replace(temp_path, asset_path)
+    return asset_ref
+
+def resolve_asset(asset_ref):
+    if not asset_ref:
+        return None
+    asset_path = get_asset_path(asset_ref)
+    if not os.path.exists(asset_path):
+        raise FileNotFoundError(f"Project asset {asset_ref} is missing from {PROJECT_ASSETS_DIR}")
+    return asset_path
+
+def resolve_audio_source(audio_source):
+    """
+    Fetch the audio file of a loaded audio source, only once it is actually needed
+    """
+    if audio_source and not audio_source.get('AudioPath') and audio_source.get('AudioAsset'):
+        audio_source['AudioPath'] = resolve_asset(audio_source['AudioAsset'])
+    return audio_source
+
+def resolve_all_audio_sources(audio_sources):
+    for group in AUDIO_SOURCE_GROUPS:
+        for audio_source in audio_sources.get(group, []):
+            resolve_audio_source(audio_source)
+    return audio_sources
+
+# --- Save & load ---
+def _to_project_audio_source(audio_source, stored_assets):
+    project_audio_source = dict(audio_source)
+    audio_path = project_audio_source.pop('AudioPath', None)
+    # Sources that were loaded from a project and left untouched already point into the asset store
+    asset_ref = project_audio_source.get('AudioAsset')
+    if audio_path and not (asset_ref and os.path.abspath(audio_path) == os.path.abspath(get_asset_path(asset_ref))):
+        # Audio sources often share a file, so hash each path only once per save
+        if audio_path not in stored_assets:
+            stored_assets[audio_path] = store_asset(audio_path)
+        project_audio_source['AudioAsset'] = stored_assets[audio_path]
+    return project_audio_source
+
+def save_project(audio_sources, video_info, output_directory=PROJECT_EXPORTS_DIR):
+    if not video_info or not video_info.get('VideoPath'):
+        raise ValueError("There is no video to save a project for.")
+
+    project_video_info = dict(video_info)
+    project_video_info['VideoAsset'] = store_asset(project_video_info.pop('VideoPath'))
+    project_data = {
+        "Format": PROJECT_FORMAT,
+        "Version": PROJECT_FORMAT_VERSION,
+        "VideoInfo": project_video_info,
+    }
+    stored_assets = {}
+    for group in AUDIO_SOURCE_GROUPS:
+        project_data[group] = [_to_project_audio_source(audio_source, stored_assets) for audio_source in (audio_sources or {}).get(group, [])]
+
+    os.makedirs(output_directory, exist_ok=True)
+    video_name, _ = os.path.splitext(os.path.basename(video_info['VideoPath']))
+    project_path = os.path.join(output_directory, f"{video_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{PROJECT_FILE_EXTENSION}")
+    with open(project_path, 'w') as f:
+        json.dump(project_data, f, separators=(',', ':'))
+    return project_path
+
+def _validate_keys(data, required_keys, description):
+    for key, value_type in required_keys.items():
+        value = data.get(key)
+        # bool is a subclass of int, but never a valid value for any of these keys
+        if not isinstance(value, value_type) or isinstance(value, bool):
+            raise ValueError(f"{description} is missing a valid '{key}'.")
+
+def load_project(project_path):
+    with open(project_path, 'r') as f:
+        project_data = json.load(f)
+
+    if not isinstance(project_data, dict) or project_data.get("Format") != PROJECT_FORMAT:
+        raise ValueError("Not an Auto-Foley project file.")
+    version = project_data.get("Version")
+    if not isinstance(version, int) or isinstance(version, bool) or not 1 <= version <= PROJECT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported project version {version}, expected 1 to {PROJECT_FORMAT_VERSION}.")
+
+    video_info = project_data.get('VideoInfo')
+    if not isinstance(video_info, dict):
+        raise ValueError("The project has no video info.")
+    _validate_keys(video_info, REQUIRED_VIDEO_INFO_KEYS, "The video info")
+    if not is_valid_asset_ref(video_info.get('VideoAsset')):
+        raise ValueError("The project has no valid video asset reference.")
+
+    audio_sources = {}
+    for group in AUDIO_SOURCE_GROUPS:
+        group_sources = project_data.get(group, [])
+        if not isinstance(group_sources, list) or not all(isinstance(audio_source, dict) for audio_source in group_sources):
+            raise ValueError(f"{group} must be a list of audio sources.")
+        for audio_source in group_sources:
+            _validate_keys(audio_source, REQUIRED_AUDIO_SOURCE_KEYS, f"An audio source in {group}")
+            if 'AudioAsset' in audio_source and audio_source['AudioAsset'] is not None and not is_valid_asset_ref(audio_source['AudioAsset']):
+                raise ValueError(f"Audio source {audio_source['SourceSlugID']} has an invalid audio asset reference.")
+        audio_sources[group] = group_sources
+
+    video_info['VideoPath'] = resolve_asset(video_info.pop('VideoAsset'))
+    # Audio assets stay unresolved until an audio source is selected or rendered
+    for group in AUDIO_SOURCE_GROUPS:
+        for audio_source in audio_sources[group]:
+            audio_source['AudioPath'] = None
+    return audio_sources, video_info
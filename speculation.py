@@ -0,0 +1,167 @@
+import job_queue
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from moviepy.config import get_setting
+
+# Speculative work started right after a video is uploaded, while the user is still tuning the input controls.
+# Jobs are tracked per Gradio session so a new upload or a closed session can cancel the work that became useless.
+
+# Per-session scratch space, not a shared cache. It sits under the shared directory so render workers can read the audio-less copy
+SPECULATION_CACHE_DIR = os.path.join(job_queue.SHARED_CACHE_DIR, "speculation")
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speculation")
+_jobs_lock = threading.Lock()
+_jobs = {}  # session hash -> job dict
+_claimed_jobs = {}  # stripped video path -> job dict, while a render is reading it
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    "started": 0,
+    "cancelled": 0,
+    "stripped_video_completed": 0,
+    "stripped_video_hits": 0,
+    "stripped_video_misses": 0,
+}
+
+class SpeculationCancelled(Exception):
+    pass
+
+def _count(metric):
+    with _metrics_lock:
+        _metrics[metric] += 1
+
+def _record_use(hit):
+    _count("stripped_video_hits" if hit else "stripped_video_misses")
+    print(format_speculation_metrics())
+
+def get_speculation_metrics():
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    used = metrics["stripped_video_hits"] + metrics["stripped_video_misses"]
+    metrics["stripped_video_hit_rate"] = metrics["stripped_video_hits"] / used if used else 0.0
+    return metrics
+
+def format_speculation_metrics():
+    metrics = get_speculation_metrics()
+    return (f"Speculation: {metrics['started']} started, {metrics['cancelled']} cancelled, {metrics['stripped_video_completed']} audio-less copies made, "
+            f"{metrics['stripped_video_hits']} used and {metrics['stripped_video_misses']} missed by renders ({metrics['stripped_video_hit_rate']:.0%} hit rate)")
+
+# --- Speculative stages ---
+def _check_cancelled(event):
+    if event.is_set():
+        raise SpeculationCancelled()
+
+def strip_audio_stream(video_path, output_path, cancel_event):
+    # Copy the video stream without re-encoding so combining audio later doesn't have to demux the original track
+    command = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-i", video_path, "-an", "-c:v", "copy", output_path]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    while True:
+        try:
+            _, stderr = process.communicate(timeout=0.25)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel_event.is_set():
+                process.kill()
+                process.communicate()
+                raise SpeculationCancelled()
+    if process.returncode != 0:
+        raise OSError(f"ffmpeg failed to strip the audio stream: {stderr.decode(errors='replace').strip()}")
+    return output_path
+
+def _run_speculation(job):
+    cancel_event = job['cancel_event']
+    try:
+        _check_cancelled(cancel_event)
+        _, file_extension = os.path.splitext(job['video_path'])
+        stripped_video_path = os.path.join(job['cache_dir'], f"video_only{file_extension}")
+        job['stripped_video_path'] = strip_audio_stream(job['video_path'], stripped_video_path, cancel_event)
+        _count("stripped_video_completed")
+    except SpeculationCancelled:
+        pass
+    except Exception as e:
+        logger.warning(f"Speculative pre-processing of {job['video_path']} failed: {e}")
+
+# --- Session handling ---
+def clear_speculation_cache():
+    # Sessions don't survive a restart, so whatever a previous run left behind is unreachable
+    shutil.rmtree(SPECULATION_CACHE_DIR, ignore_errors=True)
+
+def _remove_job_files_if_unused(job):
+    # Called with _jobs_lock held. A cancelled job keeps its files until the worker and every render using them are done
+    if job['cancel_event'].is_set() and job['future'].done() and job['claims'] == 0:
+        shutil.rmtree(job['cache_dir'], ignore_errors=True)
+
+def _on_job_done(job):
+    with _jobs_lock:
+        _remove_job_files_if_unused(job)
+
+def start_speculation(session_hash, video_path):
+    cancel_speculation(session_hash)
+    if not video_path:
+        return
+
+    os.makedirs(SPECULATION_CACHE_DIR, exist_ok=True)
+    cache_dir = tempfile.mkdtemp(prefix=f"{session_hash}_", dir=SPECULATION_CACHE_DIR)
+    job = {
+        'video_path': video_path,
+        'cache_dir': cache_dir,
+        'cancel_event': threading.Event(),
+        'stripped_video_path': None,
+        'claims': 0,
+    }
+    with _jobs_lock:
+        _jobs[session_hash] = job
+        job['future'] = _executor.submit(_run_speculation, job)
+    job['future'].add_done_callback(lambda _: _on_job_done(job))
+    _count("started")
+
+def cancel_speculation(session_hash):
+    """
+    Cancel the speculative job of a session, e.g. on a new upload or when the session is closed
+    """
+    with _jobs_lock:
+        job = _jobs.pop(session_hash, None)
+        if job is None:
+            return
+        if not job['future'].done():
+            _count("cancelled")
+        job['cancel_event'].set()
+        _remove_job_files_if_unused(job)
+
+def claim_stripped_video(session_hash, video_path):
+    """
+    Return the audio-less copy of video_path if it is ready. Every successful claim must be paired with release_stripped_video
+    """
+    with _jobs_lock:
+        job = _jobs.get(session_hash)
+        if job is None:
+            # Nothing was speculated for this session, e.g. the video came from an imported project
+            return None
+        if job['video_path'] == video_path:
+            stripped_video_path = job['stripped_video_path']
+            if stripped_video_path and os.path.exists(stripped_video_path):
+                job['claims'] += 1
+                _claimed_jobs[stripped_video_path] = job
+                _record_use(True)
+                return stripped_video_path
+    _record_use(False)
+    return None
+
+def release_stripped_video(stripped_video_path):
+    with _jobs_lock:
+        job = _claimed_jobs.get(stripped_video_path)
+        if job is None:
+            return
+        job['claims'] -= 1
+        if job['claims'] == 0:
+            del _claimed_jobs[stripped_video_path]
+        _remove_job_files_if_unused(job)
+
+clear_speculation_cache()